@@ -0,0 +1,127 @@
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+
+# Версии живут в памяти процесса: после рестарта меняется _boot_id,
+# и все выданные ранее ETag перестают совпадать
+_boot_id = uuid.uuid4().hex[:8]
+_versions: Dict[str, int] = {}
+_modified_at: Dict[str, datetime] = {}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+_started_at = _now()
+
+_responses: "OrderedDict[Tuple[str, str], Tuple[int, bytes]]" = OrderedDict()
+
+
+def bump_version(table: str) -> None:
+    """
+    Отметить изменение таблицы: сбрасывает ETag и серверный кэш ответов.
+    """
+    _versions[table] = _versions.get(table, 0) + 1
+    _modified_at[table] = _now()
+
+
+def clear() -> None:
+    _versions.clear()
+    _modified_at.clear()
+    _responses.clear()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_tables(session: Session, flush_context) -> None:
+    changed: Set[str] = session.info.setdefault("changed_tables", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            changed.add(table)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_changed_tables(session: Session) -> None:
+    # Версия растёт только после коммита, чтобы читатель не закэшировал
+    # незакоммиченное состояние под новой версией
+    for table in session.info.pop("changed_tables", ()):
+        bump_version(table)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_tables(session: Session) -> None:
+    session.info.pop("changed_tables", None)
+
+
+def _etag(table: str, version: int) -> str:
+    return f'"{table}-{_boot_id}-{version}"'
+
+
+def _not_modified(
+    request: Request, etag: str, last_modified: datetime, reliable: bool
+) -> bool:
+    # "*" не обрабатываем: без чтения из БД неизвестно, существует ли ресурс
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and reliable:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return since.tzinfo is not None and last_modified <= since
+    return False
+
+
+async def cached_response(
+    request: Request, table: str, load: Callable[[], Awaitable[bytes]]
+) -> Response:
+    """
+    Ответ GET-эндпоинта с ETag/Last-Modified по версии таблицы.
+    Условный запрос с актуальным ETag получает 304 без обращения к БД.
+    """
+    # Версию фиксируем до чтения из БД: если запись закоммитят во время
+    # загрузки, свежие данные уйдут под старой версией и не залипнут в кэше
+    version = _versions.get(table, 0)
+    etag = _etag(table, version)
+    last_modified = _modified_at.get(table, _started_at)
+    # Точность Last-Modified — секунда: пока она не закончилась, в неё ещё
+    # может попасть запись, поэтому такую дату не отдаём и IMS по ней не верим
+    reliable = last_modified < _now()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if reliable:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if _not_modified(request, etag, last_modified, reliable):
+        return Response(status_code=304, headers=headers)
+
+    key = (request.url.path, str(sorted(request.query_params.multi_items())))
+    body: Optional[bytes] = None
+    if RESPONSE_CACHE_ENABLED:
+        cached = _responses.get(key)
+        if cached is not None and cached[0] == version:
+            _responses.move_to_end(key)
+            body = cached[1]
+
+    if body is None:
+        body = await load()
+        if RESPONSE_CACHE_ENABLED:
+            _responses[key] = (version, body)
+            _responses.move_to_end(key)
+            while len(_responses) > RESPONSE_CACHE_MAX_ENTRIES:
+                _responses.popitem(last=False)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,212 @@
+import math
+import time
+from typing import Awaitable, Callable, Dict, Optional, Protocol, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+
+import schemas
+
+# Токен-бакет на контроллер: устойчивый поток и допустимый всплеск
+RATE_PER_SECOND = 5.0
+BURST = 10
+
+# Порог перегрузки: сколько запросов одновременно в работе
+# и какая средняя задержка уже считается опасной
+MAX_IN_FLIGHT = 64
+LATENCY_THRESHOLD_SECONDS = 0.5
+LATENCY_WINDOW_SECONDS = 5.0
+LATENCY_EWMA_ALPHA = 0.2
+
+# Заезд/выезд и метрики не отбрасываются даже под нагрузкой
+UNSHEDDABLE_PATHS = {"/client_parkings", "/admin/metrics"}
+UNSAMPLED_STATUSES = {304, 429, 503}
+
+
+class BucketStore(Protocol):
+    async def take(self, key: str, rate: float, capacity: int) -> float:
+        """
+        Забрать токен из бакета key.
+        Возвращает 0, если токен выдан, иначе сколько секунд ждать.
+        Время отсчитывает сам стор: общему хранилищу нужны часы его сервера,
+        а не монотонные часы отдельного процесса.
+        """
+        ...
+
+    def __len__(self) -> int: ...
+
+
+class MemoryBucketStore:
+    def __init__(
+        self,
+        max_keys: int = 10000,
+        prune_interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_keys = max_keys
+        self.prune_interval = prune_interval
+        self._clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._last_prune: Optional[float] = None
+
+    async def take(self, key: str, rate: float, capacity: int) -> float:
+        now = self._clock()
+        tokens, updated_at = self._buckets.get(key, (float(capacity), now))
+        tokens = min(float(capacity), tokens + (now - updated_at) * rate)
+
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+        self._buckets[key] = (tokens - 1, now)
+        if len(self._buckets) > self.max_keys:
+            self._prune(rate, capacity, now)
+        return 0.0
+
+    def _prune(self, rate: float, capacity: int, now: float) -> None:
+        # Ключи приходят из X-Controller-Id, их можно нагенерировать:
+        # полный проход не чаще раза в prune_interval
+        if self._last_prune is not None:
+            if now - self._last_prune < self.prune_interval:
+                return
+        self._last_prune = now
+        # Полный бакет ничем не отличается от отсутствующего
+        self._buckets = {
+            key: (tokens, updated_at)
+            for key, (tokens, updated_at) in self._buckets.items()
+            if tokens + (now - updated_at) * rate < capacity
+        }
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    def __init__(
+        self, store: BucketStore, rate: float = RATE_PER_SECOND, capacity: int = BURST
+    ) -> None:
+        self.store = store
+        self.rate = rate
+        self.capacity = capacity
+        self.allowed = 0
+        self.limited = 0
+
+    async def hit(self, key: str) -> float:
+        retry_after = await self.store.take(key, self.rate, self.capacity)
+        if retry_after:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+
+class LoadShedder:
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        latency_threshold: float = LATENCY_THRESHOLD_SECONDS,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.latency_threshold = latency_threshold
+        self.in_flight = 0
+        self.latency_ewma = 0.0
+        self.shed = 0
+        self._last_sample: Optional[float] = None
+
+    def overloaded(self) -> bool:
+        if self.in_flight >= self.max_in_flight:
+            return True
+        # Старая оценка задержки не должна держать сервер в режиме перегрузки,
+        # если быстрых запросов давно не было
+        if self._last_sample is None:
+            return False
+        if time.monotonic() - self._last_sample > LATENCY_WINDOW_SECONDS:
+            return False
+        return self.latency_ewma > self.latency_threshold
+
+    def record(self, latency: float) -> None:
+        if self._last_sample is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+        self._last_sample = time.monotonic()
+
+
+limiter = RateLimiter(MemoryBucketStore())
+shedder = LoadShedder()
+
+
+def configure(
+    store: BucketStore, rate: float = RATE_PER_SECOND, capacity: int = BURST
+) -> None:
+    """
+    Подключить хранилище бакетов, например общее для нескольких процессов.
+    """
+    global limiter
+    limiter = RateLimiter(store, rate=rate, capacity=capacity)
+
+
+def reset() -> None:
+    global shedder
+    configure(MemoryBucketStore())
+    shedder = LoadShedder()
+
+
+def controller_key(request: Request) -> str:
+    controller_id = request.headers.get("x-controller-id")
+    if controller_id:
+        return f"controller:{controller_id}"
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+
+async def rate_limit(request: Request) -> None:
+    retry_after = await limiter.hit(controller_key(request))
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Слишком много запросов, повторите позже",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+async def shed_load(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    if request.url.path not in UNSHEDDABLE_PATHS and shedder.overloaded():
+        shedder.shed += 1
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Сервер перегружен, повторите позже"},
+            headers={"Retry-After": "1"},
+        )
+
+    started = time.monotonic()
+    shedder.in_flight += 1
+    try:
+        response = await call_next(request)
+    finally:
+        shedder.in_flight -= 1
+
+    # Мгновенные отказы и 304 не отражают нагрузку: в шторм ретраев
+    # они утянули бы среднюю задержку вниз и отключили бы сброс
+    if response.status_code not in UNSAMPLED_STATUSES:
+        shedder.record(time.monotonic() - started)
+    return response
+
+
+def metrics() -> schemas.LimiterMetrics:
+    return schemas.LimiterMetrics(
+        rate_per_second=limiter.rate,
+        burst=limiter.capacity,
+        buckets=len(limiter.store),
+        allowed=limiter.allowed,
+        limited=limiter.limited,
+        in_flight=shedder.in_flight,
+        latency_ewma=shedder.latency_ewma,
+        overloaded=shedder.overloaded(),
+        shed=shedder.shed,
+    )
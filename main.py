@@ -1,7 +1,10 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 
+import limits
+import reconciler
 from db import Base, engine
 from routers import router
 
@@ -10,9 +13,14 @@ from routers import router
 async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    reconcile_task = asyncio.create_task(reconciler.run_periodically())
     yield
+    reconcile_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await reconcile_task
 
 
 app = FastAPI(title="Yoda Parking API", version="2.0", lifespan=lifespan)
 
+app.middleware("http")(limits.shed_load)
 app.include_router(router)
@@ -3,6 +3,7 @@ from typing import Optional
 
 from sqlalchemy import (
     ForeignKey,
+    Index,
     String,
     UniqueConstraint,
 )
@@ -36,6 +37,8 @@ class ClientParking(Base):
 
     __table_args__ = (
         UniqueConstraint("client_id", "parking_id", name="unique_client_parking"),
+        # Открытые сессии по парковке: сверка свободных мест без скана истории
+        Index("ix_client_parking_open", "parking_id", "time_out"),
     )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import Select, case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import schemas
+from db import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = 60
+# Полная сверка ловит то, что мимо API: ручные правки в БД,
+# записи из других процессов, упавшие откаты
+FULL_SCAN_INTERVAL_SECONDS = 600
+# Ограничение на размер IN (...) — SQLite не любит тысячи параметров в запросе
+CHUNK_SIZE = 500
+
+_touched_parkings: Set[int] = set()
+_last_full_scan: Optional[float] = None
+
+
+def mark_touched(parking_id: int) -> None:
+    """
+    Пометить парковку как изменённую с момента последней сверки.
+    """
+    _touched_parkings.add(parking_id)
+
+
+def reset() -> None:
+    global _last_full_scan
+    _touched_parkings.clear()
+    _last_full_scan = None
+
+
+def _chunks(ids: List[int]) -> Iterable[List[int]]:
+    for start in range(0, len(ids), CHUNK_SIZE):
+        end = start + CHUNK_SIZE
+        yield ids[start:end]
+
+
+def _occupied_query() -> Select:
+    # Идёт по ix_client_parking_open, не трогая историю закрытых сессий
+    return (
+        select(models.ClientParking.parking_id, func.count(models.ClientParking.id))
+        .where(models.ClientParking.time_out.is_(None))
+        .group_by(models.ClientParking.parking_id)
+    )
+
+
+async def _occupied_places(
+    db: AsyncSession, parking_ids: Optional[List[int]]
+) -> Dict[int, int]:
+    query = _occupied_query()
+    if parking_ids is None:
+        result = await db.execute(query)
+        return {parking_id: count for parking_id, count in result.all()}
+
+    occupied: Dict[int, int] = {}
+    for chunk in _chunks(parking_ids):
+        result = await db.execute(
+            query.where(models.ClientParking.parking_id.in_(chunk))
+        )
+        occupied.update({parking_id: count for parking_id, count in result.all()})
+    return occupied
+
+
+async def _stored_counters(
+    db: AsyncSession, parking_ids: Optional[List[int]]
+) -> List[Tuple[int, int, int]]:
+    query = select(
+        models.Parking.id,
+        models.Parking.count_places,
+        models.Parking.count_available_places,
+    )
+    if parking_ids is None:
+        result = await db.execute(query)
+        return list(result.tuples().all())
+
+    rows: List[Tuple[int, int, int]] = []
+    for chunk in _chunks(parking_ids):
+        result = await db.execute(query.where(models.Parking.id.in_(chunk)))
+        rows.extend(result.tuples().all())
+    return rows
+
+
+async def _fix_counters(db: AsyncSession, parking_ids: List[int]) -> None:
+    # Пересчёт внутри UPDATE, чтобы не затереть заезд/выезд,
+    # закоммиченный между чтением и исправлением
+    occupied = (
+        select(func.count(models.ClientParking.id))
+        .where(
+            models.ClientParking.parking_id == models.Parking.id,
+            models.ClientParking.time_out.is_(None),
+        )
+        .scalar_subquery()
+    )
+    available = models.Parking.count_places - occupied
+    for chunk in _chunks(parking_ids):
+        # opened ведём так же, как заезд/выезд: закрыта только без свободных мест
+        await db.execute(
+            update(models.Parking)
+            .where(models.Parking.id.in_(chunk))
+            .values(
+                count_available_places=available,
+                opened=case((available > 0, True), else_=False),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def reconcile(
+    db: AsyncSession, fix: bool = False, full: bool = False
+) -> schemas.ReconcileReport:
+    """
+    Сверка count_available_places с количеством открытых сессий.
+    Без full проверяются только парковки, изменённые через API с прошлой
+    сверки с fix; первый запуск после старта процесса и далее раз в
+    FULL_SCAN_INTERVAL_SECONDS сверка всегда полная.
+    """
+    global _last_full_scan
+
+    started = time.monotonic()
+    full = (
+        full
+        or _last_full_scan is None
+        or started - _last_full_scan >= FULL_SCAN_INTERVAL_SECONDS
+    )
+    touched = set(_touched_parkings)
+    parking_ids = None if full else sorted(touched)
+    # Прогон только с отчётом ничего не исправляет, поэтому не забирает
+    # изменённые парковки и не сдвигает плановую полную сверку
+    if fix:
+        _touched_parkings.difference_update(touched)
+
+    try:
+        if parking_ids == []:
+            return schemas.ReconcileReport(full=False, checked=0, fixed=False)
+
+        occupied = await _occupied_places(db, parking_ids)
+        counters = await _stored_counters(db, parking_ids)
+
+        drifts = []
+        for parking_id, count_places, stored in counters:
+            expected = count_places - occupied.get(parking_id, 0)
+            if stored != expected:
+                drifts.append(
+                    schemas.ParkingDrift(
+                        parking_id=parking_id,
+                        stored=stored,
+                        expected=expected,
+                        drift=stored - expected,
+                    )
+                )
+
+        if fix and drifts:
+            await _fix_counters(db, [d.parking_id for d in drifts])
+            await db.commit()
+    except Exception:
+        _touched_parkings.update(touched)
+        raise
+
+    if full and fix:
+        _last_full_scan = started
+
+    for drift in drifts:
+        logger.warning(
+            "Расхождение мест на парковке %s: %s вместо %s",
+            drift.parking_id,
+            drift.stored,
+            drift.expected,
+        )
+
+    return schemas.ReconcileReport(
+        full=full,
+        checked=len(counters),
+        fixed=fix and bool(drifts),
+        drifts=drifts,
+    )
+
+
+async def run_periodically(
+    interval: float = RECONCILE_INTERVAL_SECONDS, fix: bool = True
+) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as session:
+                await reconcile(session, fix=fix)
+        except Exception:  # noqa: PIE786 - фоновая задача не должна умирать
+            logger.exception("Сверка свободных мест завершилась ошибкой")
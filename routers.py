@@ -1,16 +1,22 @@
 from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import TypeAdapter
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import cache
+import limits
 import models
+import reconciler
 import schemas
 from db import get_db
 
 router = APIRouter()
 db_dep = Depends(get_db)
+rate_limit_dep = Depends(limits.rate_limit)
+clients_adapter = TypeAdapter(List[schemas.ClientResponse])
 
 
 @router.get("/", tags=["General"])
@@ -19,20 +25,31 @@ async def head():
 
 
 @router.get("/clients", response_model=List[schemas.ClientResponse], tags=["Clients"])
-async def get_clients(db: AsyncSession = db_dep):
-    query = select(models.Client)
-    result = await db.execute(query)
-    return result.scalars().all()
+async def get_clients(request: Request, db: AsyncSession = db_dep):
+    async def load() -> bytes:
+        query = select(models.Client)
+        result = await db.execute(query)
+        clients = clients_adapter.validate_python(
+            result.scalars().all(), from_attributes=True
+        )
+        return clients_adapter.dump_json(clients)
+
+    return await cache.cached_response(request, models.Client.__tablename__, load)
 
 
 @router.get(
     "/clients/{client_id}", response_model=schemas.ClientResponse, tags=["Clients"]
 )
-async def get_client_detail(client_id: int, db: AsyncSession = db_dep):
-    client = await db.get(models.Client, client_id)
-    if not client:
-        raise HTTPException(status_code=404, detail="Клиент не найден")
-    return client
+async def get_client_detail(
+    client_id: int, request: Request, db: AsyncSession = db_dep
+):
+    async def load() -> bytes:
+        client = await db.get(models.Client, client_id)
+        if not client:
+            raise HTTPException(status_code=404, detail="Клиент не найден")
+        return schemas.ClientResponse.model_validate(client).model_dump_json().encode()
+
+    return await cache.cached_response(request, models.Client.__tablename__, load)
 
 
 @router.post(
@@ -69,10 +86,16 @@ async def create_parking(
     db.add(new_parking)
     await db.commit()
     await db.refresh(new_parking)
+    reconciler.mark_touched(new_parking.id)
     return new_parking
 
 
-@router.post("/client_parkings", status_code=201, tags=["Operations"])
+@router.post(
+    "/client_parkings",
+    status_code=201,
+    tags=["Operations"],
+    dependencies=[rate_limit_dep],
+)
 async def enter_parking(action: schemas.ParkingAction, db: AsyncSession = db_dep):
     parking = await db.get(models.Parking, action.parking_id)
     client = await db.get(models.Client, action.client_id)
@@ -111,11 +134,13 @@ async def enter_parking(action: schemas.ParkingAction, db: AsyncSession = db_dep
         raise HTTPException(
             status_code=400, detail=f"Не удалось заехать. Ошибка БД: {str(e)}"
         )
+    finally:
+        reconciler.mark_touched(action.parking_id)
 
     return {"message": "Заезд разрешен"}
 
 
-@router.delete("/client_parkings", tags=["Operations"])
+@router.delete("/client_parkings", tags=["Operations"], dependencies=[rate_limit_dep])
 async def exit_parking(action: schemas.ParkingAction, db: AsyncSession = db_dep):
     client = await db.get(models.Client, action.client_id)
     if not client:
@@ -142,6 +167,21 @@ async def exit_parking(action: schemas.ParkingAction, db: AsyncSession = db_dep)
         parking.count_available_places += 1
         parking.opened = True
 
-    await db.commit()
+    try:
+        await db.commit()
+    finally:
+        reconciler.mark_touched(action.parking_id)
 
     return {"message": "Оплата произведена, выезд разрешен"}
+
+
+@router.post("/admin/reconcile", response_model=schemas.ReconcileReport, tags=["Admin"])
+async def reconcile_places(
+    fix: bool = False, full: bool = False, db: AsyncSession = db_dep
+):
+    return await reconciler.reconcile(db, fix=fix, full=full)
+
+
+@router.get("/admin/metrics", response_model=schemas.LimiterMetrics, tags=["Admin"])
+async def limiter_metrics():
+    return limits.metrics()
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, ConfigDict
 
@@ -40,3 +40,29 @@ class ParkingResponse(ParkingBase):
 class ParkingAction(BaseModel):
     client_id: int
     parking_id: int
+
+
+class ParkingDrift(BaseModel):
+    parking_id: int
+    stored: int
+    expected: int
+    drift: int
+
+
+class ReconcileReport(BaseModel):
+    full: bool
+    checked: int
+    fixed: bool
+    drifts: List[ParkingDrift] = []
+
+
+class LimiterMetrics(BaseModel):
+    rate_per_second: float
+    burst: int
+    buckets: int
+    allowed: int
+    limited: int
+    in_flight: int
+    latency_ewma: float
+    overloaded: bool
+    shed: int
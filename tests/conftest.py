@@ -4,6 +4,9 @@ import pytest
 from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
+import cache
+import limits
+import reconciler
 from db import Base, get_db
 from main import app
 from models import Client, ClientParking, Parking
@@ -21,6 +24,9 @@ TestingSessionLocal = async_sessionmaker(
 
 @pytest.fixture(scope="function")
 async def db_session():
+    cache.clear()
+    limits.reset()
+    reconciler.reset()
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
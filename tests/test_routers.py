@@ -1,6 +1,14 @@
+import time
+from datetime import timedelta
+from email.utils import format_datetime
+
 import pytest
-from sqlalchemy import select
+from fastapi import Request
+from sqlalchemy import select, text
 
+import cache
+import limits
+import reconciler
 from models import Client, ClientParking, Parking
 from schemas import ClientResponse
 from tests.factories import ClientFactory, ParkingFactory
@@ -314,3 +322,436 @@ async def test_exit_parking_record_not_found(client, db_session, init_data):
 
     assert resp.status_code == 404
     assert "Автомобиль не найден" in resp.json()["detail"]
+
+
+@pytest.mark.reconcile
+async def test_reconcile_no_drift(client, db_session, init_data):
+    """
+    Сверка: счётчик совпадает с открытыми сессиями.
+    """
+    resp = await client.post("/admin/reconcile", params={"full": True})
+    assert resp.status_code == 200
+
+    report = resp.json()
+    assert report["full"] is True
+    assert report["checked"] == 1
+    assert report["drifts"] == []
+
+
+@pytest.mark.reconcile
+async def test_reconcile_report_only(client, db_session, init_data):
+    """
+    Сверка без fix: расхождение найдено, но не исправлено.
+    """
+    parking = await db_session.get(Parking, 1)
+    parking.count_available_places = 10
+    await db_session.commit()
+
+    resp = await client.post("/admin/reconcile", params={"full": True})
+    assert resp.status_code == 200
+
+    report = resp.json()
+    assert report["fixed"] is False
+    assert report["drifts"] == [
+        {"parking_id": 1, "stored": 10, "expected": 999999, "drift": -999989}
+    ]
+
+    await db_session.refresh(parking)
+    assert parking.count_available_places == 10
+
+
+@pytest.mark.reconcile
+async def test_reconcile_fix(client, db_session, init_data):
+    """
+    Сверка с fix: счётчик пересчитан по открытым сессиям.
+    """
+    parking = await db_session.get(Parking, 1)
+    parking.count_available_places = 10
+    await db_session.commit()
+
+    resp = await client.post("/admin/reconcile", params={"full": True, "fix": True})
+    assert resp.status_code == 200
+    assert resp.json()["fixed"] is True
+
+    await db_session.refresh(parking)
+    assert parking.count_available_places == 999999
+
+
+@pytest.mark.reconcile
+async def test_reconcile_query_uses_open_sessions_index(db_session):
+    """
+    Подсчёт открытых сессий идёт по индексу, а не сканом всей истории.
+    """
+    query = reconciler._occupied_query().where(ClientParking.parking_id.in_([1, 2]))
+    compiled = query.compile(
+        dialect=db_session.bind.dialect, compile_kwargs={"literal_binds": True}
+    )
+    result = await db_session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+    plan = " ".join(row[3] for row in result.all())
+
+    assert "COVERING INDEX ix_client_parking_open" in plan
+    assert "SCAN client_parking" not in plan
+
+
+@pytest.mark.reconcile
+async def test_reconcile_fix_reopens_parking(client, db_session, init_data):
+    """
+    Сверка с fix открывает парковку, закрытую из-за фантомной занятости.
+    """
+    parking = await db_session.get(Parking, 1)
+    parking.count_available_places = 0
+    parking.opened = False
+    await db_session.commit()
+
+    resp = await client.post("/admin/reconcile", params={"full": True, "fix": True})
+    assert resp.json()["fixed"] is True
+
+    await db_session.refresh(parking)
+    assert parking.count_available_places == 999999
+    assert parking.opened is True
+
+    resp = await client.post("/client_parkings", json={"client_id": 3, "parking_id": 1})
+    assert resp.status_code == 201
+
+
+@pytest.mark.reconcile
+async def test_reconcile_incremental(client, db_session, init_data):
+    """
+    Инкрементальная сверка проверяет только парковки, затронутые с прошлого запуска.
+    """
+    await client.post("/admin/reconcile", params={"full": True, "fix": True})
+
+    other = Parking(
+        address="Татуин", opened=True, count_places=5, count_available_places=5
+    )
+    db_session.add(other)
+    await db_session.commit()
+
+    resp = await client.post("/client_parkings", json={"client_id": 3, "parking_id": 1})
+    assert resp.status_code == 201
+
+    resp = await client.post("/admin/reconcile", params={"fix": True})
+    report = resp.json()
+    assert report["full"] is False
+    assert report["checked"] == 1
+    assert report["drifts"] == []
+
+    resp = await client.post("/admin/reconcile", params={"fix": True})
+    assert resp.json()["checked"] == 0
+
+
+@pytest.mark.reconcile
+async def test_reconcile_report_then_background_fix(client, db_session, init_data):
+    """
+    Отчёт без fix не забирает парковки у фоновой сверки с fix.
+    """
+    await client.post("/admin/reconcile", params={"full": True, "fix": True})
+    last_full_scan = reconciler._last_full_scan
+
+    resp = await client.post("/client_parkings", json={"client_id": 3, "parking_id": 1})
+    assert resp.status_code == 201
+
+    parking = await db_session.get(Parking, 1)
+    parking.count_available_places -= 3
+    await db_session.commit()
+
+    resp = await client.post("/admin/reconcile")
+    assert resp.json()["drifts"][0]["drift"] == -3
+    resp = await client.post("/admin/reconcile", params={"full": True})
+    assert resp.json()["fixed"] is False
+    assert reconciler._last_full_scan == last_full_scan
+
+    report = await reconciler.reconcile(db_session, fix=True)
+    assert report.full is False
+    assert report.checked == 1
+    assert report.fixed is True
+
+    await db_session.refresh(parking)
+    assert parking.count_available_places == 999998
+
+
+@pytest.mark.reconcile
+async def test_reconcile_scheduled_full_scan(
+    client, db_session, init_data, monkeypatch
+):
+    """
+    Правка в БД мимо API находится плановой полной сверкой.
+    """
+    await client.post("/admin/reconcile", params={"full": True, "fix": True})
+
+    parking = await db_session.get(Parking, 1)
+    parking.count_available_places = 5
+    await db_session.commit()
+
+    resp = await client.post("/admin/reconcile", params={"fix": True})
+    assert resp.json()["checked"] == 0
+
+    monkeypatch.setattr(
+        reconciler,
+        "_last_full_scan",
+        time.monotonic() - reconciler.FULL_SCAN_INTERVAL_SECONDS,
+    )
+    resp = await client.post("/admin/reconcile", params={"fix": True})
+    report = resp.json()
+    assert report["full"] is True
+    assert report["fixed"] is True
+    assert report["drifts"][0]["parking_id"] == 1
+
+    await db_session.refresh(parking)
+    assert parking.count_available_places == 999999
+
+
+@pytest.mark.getters
+@pytest.mark.parametrize("route", ["/clients", "/clients/1"])
+async def test_get_clients_etag_not_modified(client, init_data, route):
+    """
+    Повторный запрос с If-None-Match получает 304 без тела.
+    """
+    response = await client.get(route)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = await client.get(route, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.getters
+async def test_get_clients_etag_changes_after_create(client, init_data):
+    """
+    Создание клиента меняет ETag и сбрасывает закэшированный список.
+    """
+    response = await client.get("/clients")
+    etag = response.headers["etag"]
+
+    data = {"name": "Оби-Ван", "surname": "Кеноби", "car_number": "K007KK"}
+    resp = await client.post("/clients", json=data)
+    assert resp.status_code == 201
+
+    response = await client.get("/clients", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert any(item["name"] == "Оби-Ван" for item in response.json())
+
+
+@pytest.mark.getters
+async def test_get_clients_if_modified_since(client, init_data, monkeypatch):
+    """
+    If-Modified-Since не раньше Last-Modified даёт 304.
+    """
+    later = cache._now() + timedelta(seconds=2)
+    monkeypatch.setattr(cache, "_now", lambda: later)
+
+    response = await client.get("/clients")
+    last_modified = response.headers["last-modified"]
+
+    response = await client.get(
+        "/clients", headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+
+
+@pytest.mark.limits
+async def test_enter_parking_rate_limited(client, db_session, init_data):
+    """
+    Контроллер, превысивший лимит, получает 429 с Retry-After.
+    """
+    headers = {"X-Controller-Id": "gate-1"}
+    payload = {"client_id": 1, "parking_id": 1}
+    for _ in range(limits.BURST):
+        resp = await client.post("/client_parkings", json=payload, headers=headers)
+        assert resp.status_code == 400
+
+    resp = await client.post("/client_parkings", json=payload, headers=headers)
+    assert resp.status_code == 429
+    assert int(resp.headers["retry-after"]) >= 1
+
+    resp = await client.post(
+        "/client_parkings", json=payload, headers={"X-Controller-Id": "gate-2"}
+    )
+    assert resp.status_code == 400
+
+
+@pytest.mark.limits
+async def test_memory_store_prunes_at_most_once_per_interval():
+    """
+    Очистка полных бакетов идёт не чаще prune_interval и по часам стора.
+    """
+    now = 0.0
+    store = limits.MemoryBucketStore(max_keys=2, prune_interval=1.0, clock=lambda: now)
+
+    for key in ("a", "b", "c"):
+        assert await store.take(key, rate=5.0, capacity=10) == 0
+    assert len(store) == 3
+
+    now = 0.5
+    await store.take("d", rate=5.0, capacity=10)
+    assert len(store) == 4
+
+    now = 1.0
+    await store.take("e", rate=5.0, capacity=10)
+    assert len(store) == 1
+
+
+@pytest.mark.limits
+async def test_configure_custom_bucket_store(client, db_session, init_data):
+    """
+    Лимитер ходит в хранилище, подключённое через configure.
+    """
+
+    class DenyStore:
+        def __init__(self):
+            self.keys = []
+
+        async def take(self, key, rate, capacity):
+            self.keys.append(key)
+            return 2.5
+
+        def __len__(self):
+            return len(self.keys)
+
+    store = DenyStore()
+    limits.configure(store)
+
+    resp = await client.post(
+        "/client_parkings",
+        json={"client_id": 3, "parking_id": 1},
+        headers={"X-Controller-Id": "gate-7"},
+    )
+    assert resp.status_code == 429
+    assert resp.headers["retry-after"] == "3"
+    assert store.keys == ["controller:gate-7"]
+
+
+@pytest.mark.limits
+async def test_reads_shed_under_load(client, init_data):
+    """
+    При перегрузке чтение получает 503, а заезд продолжает работать.
+    """
+    limits.shedder.max_in_flight = 0
+
+    resp = await client.get("/clients")
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "1"
+
+    resp = await client.post("/client_parkings", json={"client_id": 3, "parking_id": 1})
+    assert resp.status_code == 201
+
+
+@pytest.mark.limits
+async def test_rate_limited_requests_do_not_hide_latency(client, init_data):
+    """
+    Быстрые 429 не снижают оценку задержки и не отключают сброс нагрузки.
+    """
+    headers = {"X-Controller-Id": "gate-1"}
+    payload = {"client_id": 1, "parking_id": 1}
+    for _ in range(limits.BURST):
+        await client.post("/client_parkings", json=payload, headers=headers)
+
+    for _ in range(10):
+        limits.shedder.record(2.0)
+    latency_before = limits.shedder.latency_ewma
+    assert limits.shedder.overloaded() is True
+
+    for _ in range(30):
+        resp = await client.post("/client_parkings", json=payload, headers=headers)
+        assert resp.status_code == 429
+
+    assert limits.shedder.latency_ewma == latency_before
+    assert limits.shedder.overloaded() is True
+
+
+@pytest.mark.limits
+async def test_limiter_metrics(client, init_data):
+    """
+    Метрики отражают состояние лимитера и отброшенные запросы.
+    """
+    await client.post("/client_parkings", json={"client_id": 3, "parking_id": 1})
+    limits.shedder.max_in_flight = 0
+    await client.get("/clients")
+
+    resp = await client.get("/admin/metrics")
+    assert resp.status_code == 200
+
+    data = resp.json()
+    assert data["allowed"] == 1
+    assert data["limited"] == 0
+    assert data["buckets"] == 1
+    assert data["shed"] == 1
+    assert data["overloaded"] is True
+
+
+@pytest.mark.getters
+async def test_get_clients_if_modified_since_same_second(
+    client, init_data, monkeypatch
+):
+    """
+    Две записи в одну секунду: Last-Modified этой секунды не даёт ложный 304.
+    """
+    now = cache._now() + timedelta(seconds=2)
+    monkeypatch.setattr(cache, "_now", lambda: now)
+
+    data = {"name": "Оби-Ван", "surname": "Кеноби", "car_number": "K007KK"}
+    await client.post("/clients", json=data)
+    response = await client.get("/clients")
+    assert "last-modified" not in response.headers
+
+    data = {"name": "Асока", "surname": "Тано", "car_number": "T008TT"}
+    await client.post("/clients", json=data)
+
+    response = await client.get(
+        "/clients", headers={"If-Modified-Since": format_datetime(now, usegmt=True)}
+    )
+    assert response.status_code == 200
+    assert any(item["name"] == "Асока" for item in response.json())
+
+
+@pytest.mark.getters
+async def test_get_client_if_none_match_star_not_found(client, init_data):
+    """
+    If-None-Match: * не скрывает 404 для несуществующего клиента.
+    """
+    response = await client.get("/clients/999", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+
+
+@pytest.mark.getters
+async def test_cached_response_skips_load():
+    """
+    304 и попадание в серверный кэш отдаются без вызова load (без БД).
+    """
+    cache.clear()
+    calls = 0
+
+    async def load() -> bytes:
+        nonlocal calls
+        calls += 1
+        return b"[]"
+
+    def make_request(headers=()):
+        return Request(
+            {
+                "type": "http",
+                "method": "GET",
+                "path": "/clients",
+                "query_string": b"",
+                "headers": list(headers),
+            }
+        )
+
+    response = await cache.cached_response(make_request(), "client", load)
+    assert response.status_code == 200
+    assert calls == 1
+
+    response = await cache.cached_response(make_request(), "client", load)
+    assert response.status_code == 200
+    assert response.body == b"[]"
+    assert calls == 1
+
+    etag = response.headers["etag"].encode()
+    response = await cache.cached_response(
+        make_request([(b"if-none-match", etag)]), "client", load
+    )
+    assert response.status_code == 304
+    assert calls == 1